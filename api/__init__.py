@@ -6,44 +6,80 @@ from flask_jwt_extended import JWTManager
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 import pymysql
+from api.tasks import TaskQueue
 
-load_dotenv()
 pymysql.install_as_MySQLdb()
 
-# initializing Flask
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
+# create the extensions, they are bound to the app in create_app
+jwt = JWTManager()
+db = SQLAlchemy()
+tasks = TaskQueue()
 
-# jwt config
-app.config["JWT_SECRET_KEY"] = os.getenv('JWT_SECRET_KEY')
-app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=6)
-app.config["JSON_SORT_KEYS"] = False
-jwt = JWTManager(app)
 
-# create the extension
-db = SQLAlchemy()
+def create_app(config=None):
+    load_dotenv()
+
+    # initializing Flask
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
 
-# configure the SQLite database, relative to the app instance folder
-app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv('DATABASE_URI')
+    # jwt config
+    app.config["JWT_SECRET_KEY"] = os.getenv('JWT_SECRET_KEY')
+    app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=6)
+    app.config["JSON_SORT_KEYS"] = False
 
-# ssl config
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "connect_args": {
-        "ssl": {
-            "ca": os.getenv('CA_CERT'),
+    # configure the database
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv('DATABASE_URI')
+
+    # ssl config
+    if os.getenv('CA_CERT'):
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+            "connect_args": {
+                "ssl": {
+                    "ca": os.getenv('CA_CERT'),
+                }
+            }
         }
-    }
-}
 
-# cors config
-if os.getenv('ENVIRONMENT') == 'dev':
-    # allow localhost:3000
-    CORS(app, resources={r"/*": {"origins": "http://localhost:3000"}})
-else:
-    # allow only the frontend origin
-    CORS(app, resources={r"/*": {"origins": os.getenv('FRONTEND_ORIGIN')}})
+    # overrides, e.g. for benchmarks
+    if config:
+        app.config.update(config)
+
+    # cors config
+    if os.getenv('ENVIRONMENT') == 'dev':
+        # allow localhost:3000
+        CORS(app, resources={r"/*": {"origins": "http://localhost:3000"}})
+    else:
+        # allow only the frontend origin
+        CORS(app, resources={r"/*": {"origins": os.getenv('FRONTEND_ORIGIN')}})
+
+    # initialize the app with the extensions
+    jwt.init_app(app)
+    db.init_app(app)
+    tasks.init_app(app)
+
+    from api.routes import bp
+    app.register_blueprint(bp)
+
+    from api.compression import compress_response
+    app.after_request(compress_response)
+
+    return app
+
+
+def warm_up(app):
+    """Load the heavy state that is otherwise loaded lazily on first use.
 
-# initialize the app with the extension
-db.init_app(app)
+    Run this in the gunicorn master (with --preload) so that the forked
+    workers share the memory copy-on-write instead of each building it.
+    """
+    from api.filters import load_profanity
+    from api.channels import load_channels
 
-from api import routes
\ No newline at end of file
+    load_profanity()
+    with app.app_context():
+        load_channels()
+        # don't let the forked workers share the master's pooled connections,
+        # the session has to give its connection back first
+        db.session.remove()
+        db.engine.dispose()
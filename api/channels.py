@@ -0,0 +1,101 @@
+import time
+from collections import namedtuple
+from threading import Lock
+from types import MappingProxyType
+from api import db
+from api.models import Category, Channel
+
+# categories and channels come from data/categories.json and only change when
+# the database is re-seeded (run.py update), so we keep an immutable snapshot
+# of them in memory instead of querying the tables on every request
+
+# seconds between checks that the tables haven't changed since the snapshot
+CHANNEL_REGISTRY_TTL = 60
+
+
+class ChannelInfo(namedtuple('ChannelInfo', ['id', 'name', 'description', 'category_id'])):
+    __slots__ = ()
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'description': self.description,
+        }
+
+
+CategoryInfo = namedtuple('CategoryInfo', ['id', 'name', 'channels'])
+
+
+class ChannelRegistry:
+    def __init__(self, categories, channels, version=None):
+        self.version = version
+        self.categories = tuple(categories)
+        self.channels = MappingProxyType({channel.id: channel for channel in channels})
+
+        # the /categories response is the same for everyone, build it once
+        self.categories_response = {'categories': [
+            {'id': category.id, 'name': category.name, 'channels': [
+                {'id': channel.id, 'name': channel.name} for channel in category.channels]}
+            for category in self.categories
+        ]}
+
+    @classmethod
+    def from_rows(cls, categories, channels, version=None):
+        channels = [ChannelInfo(channel.id, channel.name, channel.description, channel.category_id)
+                    for channel in channels]
+        categories = [CategoryInfo(category.id, category.name,
+                                   tuple(channel for channel in channels if channel.category_id == category.id))
+                      for category in categories]
+        return cls(categories, channels, version)
+
+    def get_channel(self, channel_id):
+        # channel ids sent in request bodies may be strings, but not floats or booleans
+        if isinstance(channel_id, str) and channel_id.isascii() and channel_id.isdigit():
+            channel_id = int(channel_id)
+        elif type(channel_id) is not int:
+            return None
+        return self.channels.get(channel_id)
+
+
+_registry = None
+_registry_lock = Lock()
+_checked_at = 0
+
+
+def _tables_version():
+    # run.py update deletes and re-creates the rows, which changes their ids
+    version = ()
+    for model in (Category, Channel):
+        version += tuple(db.session.query(
+            db.func.count(model.id), db.func.max(model.id)).one())
+    return version
+
+
+def load_channels():
+    """(Re)build the channel registry from the database. Needs an app context."""
+    global _registry, _checked_at
+    version = _tables_version()
+    categories = Category.query.order_by(Category.id).all()
+    channels = Channel.query.order_by(Channel.id).all()
+    registry = ChannelRegistry.from_rows(categories, channels, version)
+    # swap the whole snapshot so readers never see a half-built registry
+    _registry = registry
+    _checked_at = time.monotonic()
+    return registry
+
+
+def get_channels():
+    """Return the channel registry, loading it on first use and reloading it
+    if the tables changed. Needs an app context."""
+    global _checked_at
+    if _registry is not None and time.monotonic() - _checked_at < CHANNEL_REGISTRY_TTL:
+        return _registry
+    with _registry_lock:
+        if _registry is None:
+            load_channels()
+        elif time.monotonic() - _checked_at >= CHANNEL_REGISTRY_TTL:
+            _checked_at = time.monotonic()
+            if _tables_version() != _registry.version:
+                load_channels()
+    return _registry
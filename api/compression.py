@@ -0,0 +1,46 @@
+import gzip
+from flask import request
+
+# brotli is optional, without it responses are only gzipped
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# responses smaller than this aren't worth the cpu time
+COMPRESS_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def _encodings():
+    # in order of preference when the client accepts several equally
+    return ['br', 'gzip'] if brotli else ['gzip']
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def compress_response(response):
+    """Compress the response with the best encoding the client accepts (registered with after_request)."""
+    if (response.status_code < 200 or response.status_code >= 300 or response.is_streamed
+            or response.direct_passthrough or 'Content-Encoding' in response.headers):
+        return response
+
+    # caches must not serve a compressed response to clients that can't read it
+    response.vary.add('Accept-Encoding')
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    encoding = request.accept_encodings.best_match(_encodings())
+    if not encoding:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
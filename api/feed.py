@@ -0,0 +1,92 @@
+from api import db
+from api.models import ChannelFollow, Post, TimelineEntry
+
+# every user's feed is a precomputed timeline of post ids from the channels
+# they follow. new posts are pushed into the followers' timelines when they
+# are created (fan-out on write) so reading a feed is one indexed range query
+
+# how many posts are kept in a timeline, older ones are evicted
+TIMELINE_LENGTH = 500
+# timelines are only trimmed once they are this many posts over the limit, so
+# a fan-out only has to trim a small share of its followers' timelines
+TIMELINE_SLACK = 50
+# how many followers' timelines are written per transaction
+FANOUT_BATCH_SIZE = 500
+
+
+def _insert_entries():
+    # a post may already be in a timeline, e.g. pushed by a backfill in another
+    # worker. those rows are skipped instead of failing the whole insert
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        return db.insert(TimelineEntry).prefix_with('OR IGNORE')
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(TimelineEntry).on_conflict_do_nothing()
+    return db.insert(TimelineEntry).prefix_with('IGNORE')
+
+
+def fan_out_post(post_id, channel_id):
+    """Push a new post into the timelines of its channel's followers."""
+    followers = [username for (username,) in db.session.query(ChannelFollow.username).filter_by(
+        channel_id=channel_id).order_by(ChannelFollow.username)]
+
+    for i in range(0, len(followers), FANOUT_BATCH_SIZE):
+        batch = followers[i:i + FANOUT_BATCH_SIZE]
+        # the followers are selected again by the insert itself, so a user who
+        # unfollowed the channel since they were read doesn't get the post
+        db.session.execute(_insert_entries().from_select(['username', 'post_id', 'channel_id'], db.select(
+            ChannelFollow.username, db.literal(post_id), db.literal(channel_id)).where(
+            ChannelFollow.channel_id == channel_id, ChannelFollow.username.in_(batch))))
+        trim_timelines(batch)
+        db.session.commit()
+
+
+def backfill_timeline(username, channel_id):
+    """Add the latest posts of a followed channel to a user's timeline."""
+    # the user may have unfollowed the channel before this ran. locking the
+    # follow makes a concurrent unfollow wait until the backfill is committed
+    follow = ChannelFollow.query.filter_by(
+        username=username, channel_id=channel_id).with_for_update().first()
+    if not follow:
+        db.session.rollback()
+        return
+
+    post_ids = [post_id for (post_id,) in db.session.query(Post.id).filter_by(
+        channel_id=channel_id, deleted=False).order_by(Post.id.desc()).limit(TIMELINE_LENGTH)]
+    if post_ids:
+        db.session.execute(_insert_entries(), [
+            {'username': username, 'post_id': post_id, 'channel_id': channel_id} for post_id in post_ids])
+        trim_timelines([username])
+    db.session.commit()
+
+
+def rebuild_timelines():
+    """Backfill every timeline, e.g. to recover fan-outs lost in a restart."""
+    follows = db.session.query(
+        ChannelFollow.username, ChannelFollow.channel_id).all()
+    for username, channel_id in follows:
+        backfill_timeline(username, channel_id)
+
+
+def trim_timelines(usernames):
+    """Evict the oldest posts from the timelines that grew past the limit."""
+    full = [username for (username,) in db.session.query(TimelineEntry.username).filter(
+        TimelineEntry.username.in_(usernames)).group_by(TimelineEntry.username).having(
+        db.func.count() > TIMELINE_LENGTH + TIMELINE_SLACK)]
+
+    for username in full:
+        # the newest post that no longer fits in the timeline
+        cutoff = db.session.query(TimelineEntry.post_id).filter_by(username=username).order_by(
+            TimelineEntry.post_id.desc()).offset(TIMELINE_LENGTH).limit(1).scalar()
+        TimelineEntry.query.filter(TimelineEntry.username == username, TimelineEntry.post_id <= cutoff).delete(
+            synchronize_session=False)
+
+
+def get_feed(username, before=None, limit=20):
+    """Return the newest posts in a user's timeline, older than the post id `before` if given."""
+    query = Post.query.join(TimelineEntry, TimelineEntry.post_id == Post.id).filter(
+        TimelineEntry.username == username, Post.deleted == False)
+    if before:
+        query = query.filter(TimelineEntry.post_id < before)
+    return query.order_by(TimelineEntry.post_id.desc()).limit(limit).all()
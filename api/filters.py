@@ -0,0 +1,25 @@
+from threading import Lock
+
+# building the profanity word list is the slowest part of startup. better_profanity
+# builds it when it is imported, so the import is deferred until the filter is
+# first needed (or done up front by api.warm_up)
+_profanity = None
+_profanity_lock = Lock()
+
+
+def load_profanity():
+    global _profanity
+    if _profanity is None:
+        with _profanity_lock:
+            if _profanity is None:
+                from better_profanity import profanity
+                _profanity = profanity
+    return _profanity
+
+
+def censor(text):
+    return load_profanity().censor(text)
+
+
+def contains_profanity(text):
+    return load_profanity().contains_profanity(text)
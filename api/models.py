@@ -1,5 +1,13 @@
-from datetime import datetime
+from datetime import datetime, timezone
 from api import db
+from api.votes import vote_cache
+
+
+def format_date(date, compact=False):
+    # the compact format uses epoch timestamps, dates are stored in utc
+    if compact:
+        return int(date.replace(tzinfo=timezone.utc).timestamp())
+    return date.strftime("%Y-%m-%d %H:%M:%S")
 
 
 class User(db.Model):
@@ -64,6 +72,22 @@ class Channel(db.Model):
         }
 
 
+class ChannelFollow(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(20), nullable=False)
+    channel_id = db.Column(db.Integer, nullable=False, index=True)
+    __table_args__ = (db.UniqueConstraint('username', 'channel_id'),)
+
+
+class TimelineEntry(db.Model):
+    # a post in a user's precomputed feed, see api/feed.py
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(20), nullable=False)
+    post_id = db.Column(db.Integer, nullable=False)
+    channel_id = db.Column(db.Integer, nullable=False)
+    __table_args__ = (db.UniqueConstraint('username', 'post_id'),)
+
+
 class Like(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(50), nullable=False)
@@ -91,41 +115,50 @@ class Post(db.Model):
         'Reply', backref='post', lazy=True, primaryjoin="foreign(Reply.post_id)==Post.id")
     edited = db.Column(db.Boolean, nullable=False, default=False)
     edited_date = db.Column(db.DateTime, nullable=True)
+    # deleted posts are hidden right away and purged in the background, see api/purge.py
+    deleted = db.Column(db.Boolean, nullable=False,
+                        default=False, index=True)
     likes = db.relationship('Like', backref='post', lazy=True,
                             primaryjoin="foreign(Like.post_id)==Post.id")
     dislikes = db.relationship(
         'Dislike', backref='post', lazy=True, primaryjoin="foreign(Dislike.post_id)==Post.id")
 
-    def to_dict(self, username=None):
+    def is_deleted(self):
+        return self.deleted
+
+    def to_dict(self, username=None, votes=None, authors=None):
+        # the viewer's votes are looked up once and passed down to the replies
+        if username and votes is None:
+            votes = vote_cache.get(username)
+        # in the compact format authors are collected in a side table and referenced by id
+        compact = authors is not None
+        if compact and self.author.id not in authors:
+            authors[self.author.id] = self.author.to_dict()
         result = {
             'id': self.id,
             'title': self.title,
             'content': self.content,
-            'author': self.author.to_dict(),
-            'date': self.date.strftime("%Y-%m-%d %H:%M:%S"),
+            'author': self.author.id if compact else self.author.to_dict(),
+            'date': format_date(self.date, compact),
             'likes': len(self.likes),
             'dislikes': len(self.dislikes),
             'liked': False,
             'disliked': False,
         }
-        if self.replies:
+        replies = [reply for reply in self.replies if not reply.deleted]
+        if replies:
             result['replies'] = [reply.to_dict(
-                username=username) for reply in self.replies if not reply.parent_reply_id]
+                username=username, votes=votes, authors=authors) for reply in replies if not reply.parent_reply_id]
         if self.edited:
             result['edited'] = True
             if self.edited_date:
-                result['edited_date'] = self.edited_date.strftime(
-                    "%Y-%m-%d %H:%M:%S")
-        if username:
-            like = Like.query.filter_by(
-                username=username, post_id=self.id).first()
-            if like:
+                result['edited_date'] = format_date(
+                    self.edited_date, compact)
+        if votes:
+            if votes.liked('post', self.id):
                 result['liked'] = True
-            else:
-                dislike = Dislike.query.filter_by(
-                    username=username, post_id=self.id).first()
-                if dislike:
-                    result['disliked'] = True
+            elif votes.disliked('post', self.id):
+                result['disliked'] = True
         return result
 
 
@@ -141,17 +174,38 @@ class Reply(db.Model):
                               id]), lazy='joined', primaryjoin="foreign(Reply.parent_reply_id)==Reply.id")
     edited = db.Column(db.Boolean, nullable=False, default=False)
     edited_date = db.Column(db.DateTime, nullable=True)
+    deleted = db.Column(db.Boolean, nullable=False,
+                        default=False, index=True)
     likes = db.relationship('Like', backref='reply', lazy=True,
                             primaryjoin="foreign(Like.reply_id)==Reply.id")
     dislikes = db.relationship('Dislike', backref='reply', lazy=True,
                                primaryjoin="foreign(Dislike.reply_id)==Reply.id")
 
-    def to_dict(self, username=None):
+    def is_deleted(self):
+        """Whether the reply, one of its parent replies or its post was deleted."""
+        reply = self
+        while not reply.deleted:
+            if not reply.parent_reply_id:
+                return self.post is None or self.post.deleted
+            reply = reply.parent_reply
+            # the parent was already purged
+            if reply is None:
+                return True
+        return True
+
+    def to_dict(self, username=None, votes=None, authors=None):
+        # the viewer's votes are looked up once and passed down to the replies
+        if username and votes is None:
+            votes = vote_cache.get(username)
+        # in the compact format authors are collected in a side table and referenced by id
+        compact = authors is not None
+        if compact and self.author.id not in authors:
+            authors[self.author.id] = self.author.to_dict()
         result = {
             'id': self.id,
             'content': self.content,
-            'author': self.author.to_dict(),
-            'date': self.date.strftime("%Y-%m-%d %H:%M:%S"),
+            'author': self.author.id if compact else self.author.to_dict(),
+            'date': format_date(self.date, compact),
             'depth': self.depth,
             'likes': len(self.likes),
             'dislikes': len(self.dislikes),
@@ -160,22 +214,18 @@ class Reply(db.Model):
         }
         if self.parent_reply_id:
             result['parent_reply'] = self.parent_reply_id
-        if self.replies:
+        replies = [reply for reply in self.replies if not reply.deleted]
+        if replies:
             result['replies'] = [reply.to_dict(
-                username=username) for reply in self.replies]
+                username=username, votes=votes, authors=authors) for reply in replies]
         if self.edited:
             result['edited'] = True
             if self.edited_date:
-                result['edited_date'] = self.edited_date.strftime(
-                    "%Y-%m-%d %H:%M:%S")
-        if username:
-            like = Like.query.filter_by(
-                username=username, reply_id=self.id).first()
-            if like:
+                result['edited_date'] = format_date(
+                    self.edited_date, compact)
+        if votes:
+            if votes.liked('reply', self.id):
                 result['liked'] = True
-            else:
-                dislike = Dislike.query.filter_by(
-                    username=username, reply_id=self.id).first()
-                if dislike:
-                    result['disliked'] = True
+            elif votes.disliked('reply', self.id):
+                result['disliked'] = True
         return result
@@ -0,0 +1,131 @@
+from api import db
+from api.models import Post, Reply, Like, Dislike, TimelineEntry
+from api.votes import vote_cache
+
+# delete_item only flags items as deleted, the functions here remove them
+# together with their replies and votes. rows are deleted in batches, with
+# a commit after each one, so a large thread never holds a long transaction
+
+# how many rows are deleted per transaction
+PURGE_BATCH_SIZE = 500
+
+
+def _chunks(ids):
+    for i in range(0, len(ids), PURGE_BATCH_SIZE):
+        yield ids[i:i + PURGE_BATCH_SIZE]
+
+
+def _delete_where(model, *criteria):
+    while True:
+        ids = [row_id for (row_id,) in db.session.query(
+            model.id).filter(*criteria).limit(PURGE_BATCH_SIZE)]
+        if not ids:
+            return
+        model.query.filter(model.id.in_(ids)).delete(
+            synchronize_session=False)
+        db.session.commit()
+
+
+def _delete_replies(reply_ids):
+    for chunk in _chunks(reply_ids):
+        _delete_where(Like, Like.reply_id.in_(chunk))
+        _delete_where(Dislike, Dislike.reply_id.in_(chunk))
+        Reply.query.filter(Reply.id.in_(chunk)).delete(
+            synchronize_session=False)
+        db.session.commit()
+        vote_cache.forget('reply', chunk)
+
+
+def _descendants(reply_ids):
+    # walk the thread one level at a time
+    subtree = []
+    level = reply_ids
+    while level:
+        children = []
+        for chunk in _chunks(level):
+            children += [child_id for (child_id,) in db.session.query(
+                Reply.id).filter(Reply.parent_reply_id.in_(chunk))]
+        subtree += children
+        level = children
+    return subtree
+
+
+def purge_post(post_id):
+    """Remove a post with all of its replies, votes and timeline entries."""
+    # scan again until nothing is left, a reply may have been created while
+    # the post was being purged
+    while True:
+        reply_ids = [reply_id for (reply_id,) in db.session.query(
+            Reply.id).filter_by(post_id=post_id)]
+        if not reply_ids:
+            break
+        _delete_replies(reply_ids)
+    _delete_where(Like, Like.post_id == post_id)
+    _delete_where(Dislike, Dislike.post_id == post_id)
+    _delete_where(TimelineEntry, TimelineEntry.post_id == post_id)
+    # the post goes last, so an interrupted purge is picked up again by purge_deleted
+    Post.query.filter_by(id=post_id).delete()
+    db.session.commit()
+    vote_cache.forget('post', [post_id])
+
+
+def _purge_orphaned_replies(post_id):
+    # replies created under a reply while it was being purged are left behind
+    # without a parent, scan again until there are none
+    parent = db.aliased(Reply)
+    while True:
+        orphans = [reply_id for (reply_id,) in db.session.query(Reply.id).filter(
+            Reply.post_id == post_id, Reply.parent_reply_id.isnot(None),
+            Reply.parent_reply_id.not_in(db.select(parent.id)))]
+        if not orphans:
+            return
+        _delete_replies(orphans + _descendants(orphans))
+
+
+def purge_reply(reply_id):
+    """Remove a reply with its nested replies and all of their votes."""
+    post_id = db.session.query(Reply.post_id).filter_by(id=reply_id).scalar()
+    _delete_replies(_descendants([reply_id]))
+    # the reply goes last, so an interrupted purge is picked up again by purge_deleted
+    _delete_replies([reply_id])
+    _purge_orphaned_replies(post_id)
+
+
+def purge_item(item_type, item_id):
+    if item_type == 'post':
+        purge_post(item_id)
+    elif item_type == 'reply':
+        purge_reply(item_id)
+
+
+def purge_orphans():
+    """Remove replies and votes whose post or parent is gone."""
+    # a write that checked its parent just before the parent was purged can
+    # still commit after the purge finished
+    parent = db.aliased(Reply)
+    orphans = db.or_(Reply.post_id.not_in(db.select(Post.id)), db.and_(
+        Reply.parent_reply_id.isnot(None), Reply.parent_reply_id.not_in(db.select(parent.id))))
+    while True:
+        reply_ids = [reply_id for (reply_id,) in db.session.query(
+            Reply.id).filter(orphans).limit(PURGE_BATCH_SIZE)]
+        if not reply_ids:
+            break
+        _delete_replies(reply_ids)
+    for model in (Like, Dislike):
+        _delete_where(model, db.or_(
+            db.and_(model.post_id.isnot(None), model.post_id.not_in(db.select(Post.id))),
+            db.and_(model.reply_id.isnot(None), model.reply_id.not_in(db.select(Reply.id)))))
+    # which items those votes were on isn't known here, so start over
+    vote_cache.clear()
+
+
+def purge_deleted():
+    """Purge every item flagged as deleted, e.g. ones left over after a restart,
+    and anything they left orphaned."""
+    for (post_id,) in db.session.query(Post.id).filter_by(deleted=True).all():
+        purge_post(post_id)
+    for (reply_id,) in db.session.query(Reply.id).filter_by(deleted=True).all():
+        # replies of a purged post or reply may already be gone
+        if db.session.query(Reply.id).filter_by(id=reply_id).first():
+            purge_reply(reply_id)
+    purge_orphans()
@@ -3,12 +3,17 @@ import os
 import re
 import bcrypt
 from datetime import datetime, timedelta, timezone
-from flask import request, jsonify
+from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token, get_jwt, get_jwt_identity, unset_jwt_cookies, jwt_required
-from api import app, db
-from api.models import User, Post, Channel, Category, Reply, Like, Role, Dislike
-from better_profanity import profanity
-profanity.load_censor_words()
+from api import db, tasks
+from api.models import User, Post, Reply, Like, Role, Dislike, ChannelFollow, TimelineEntry
+from api.channels import get_channels
+from api.feed import fan_out_post, backfill_timeline, get_feed
+from api.purge import purge_item
+from api.votes import vote_cache
+from api.filters import censor, contains_profanity
+
+bp = Blueprint('api', __name__)
 
 restricted_mode = os.environ.get("RESTRICTED_MODE", False) == True
 if restricted_mode:
@@ -18,13 +23,13 @@ if restricted_mode:
 # use this to simply ping the server
 
 
-@app.route('/ping')
-@app.route('/')
+@bp.route('/ping')
+@bp.route('/')
 def ping():
     return {"msg": "pong"}, 200
 
 
-@app.route('/signup', methods=["POST"])
+@bp.route('/signup', methods=["POST"])
 def signup():
     # get query params
     username = request.json.get("username", None)
@@ -45,7 +50,7 @@ def signup():
         return {"msg": "Username contains illegal characters."}, 400
 
     # check for profanity
-    if (profanity.contains_profanity(username)):
+    if (contains_profanity(username)):
         return {"msg": "Please choose a different username."}, 400
 
     # convert username to lowercase
@@ -83,7 +88,7 @@ def signup():
     }, 201
 
 
-@app.route('/signin', methods=["POST"])
+@bp.route('/signin', methods=["POST"])
 def signin():
     # get query params
     username = request.json.get("username", None)
@@ -126,7 +131,7 @@ def signin():
     }, 200
 
 
-@app.route("/logout", methods=["POST"])
+@bp.route("/logout", methods=["POST"])
 def logout():
     response = jsonify({"msg": "Logout successful"})
     unset_jwt_cookies(response)
@@ -135,7 +140,7 @@ def logout():
 
 # this is just a dummy endpoint to check if your JWT auth is working
 # it will return back the username associated with your JWT token
-@app.route('/identity')
+@bp.route('/identity')
 @jwt_required()
 def my_profile():
     user = User.query.filter(User.username.ilike(get_jwt_identity())).first()
@@ -172,33 +177,37 @@ def my_profile():
 # https://dev.to/nagatodev/how-to-add-login-authentication-to-a-flask-and-react-application-23i7
 
 
-@app.route('/categories')
+def posts_response(posts, username):
+    # ?format=compact lists every author once and uses epoch timestamps
+    if request.args.get('format') == 'compact':
+        authors = {}
+        posts = [post.to_dict(username=username, authors=authors)
+                 for post in posts]
+        # a list, since json would turn the int ids used as keys into strings
+        return jsonify({'authors': list(authors.values()), 'posts': posts})
+    return jsonify([post.to_dict(username=username) for post in posts])
+
+
+@bp.route('/categories')
 @jwt_required()
 def get_categories():
-    categories = Category.query.all()
-    response = []
-    for category in categories:
-        channels_list = [{'id': channel.id, 'name': channel.name}
-                         for channel in category.channels]
-        response.append(
-            {'id': category.id, 'name': category.name, 'channels': channels_list})
-    return {'categories': response}, 200
+    return get_channels().categories_response, 200
 
 
-@app.route('/post/all')
+@bp.route('/post/all')
 @jwt_required()
 def posts():
-    posts = Post.query.all()
+    posts = Post.query.filter_by(deleted=False).all()
     posts.reverse()
     username = get_jwt_identity()
-    return jsonify([post.to_dict(username=username) for post in posts])
+    return posts_response(posts, username)
 
 
-@app.route('/channel/<int:channel_id>', methods=["GET"])
+@bp.route('/channel/<int:channel_id>', methods=["GET"])
 @jwt_required()
 def get_channel(channel_id):
     # Get the channel object
-    channel = Channel.query.get(channel_id)
+    channel = get_channels().get_channel(channel_id)
 
     # Check if the channel exists
     if not channel:
@@ -207,29 +216,26 @@ def get_channel(channel_id):
     return channel.to_dict(), 200
 
 
-@app.route('/channel/<int:channel_id>/posts')
+@bp.route('/channel/<int:channel_id>/posts')
 @jwt_required()
 def get_posts_in_channel(channel_id):
-    # Get the channel object
-    channel = Channel.query.get(channel_id)
-
     # Check if the channel exists
-    if not channel:
+    if not get_channels().get_channel(channel_id):
         return {"msg": "Channel not found"}, 404
 
     username = get_jwt_identity()
     # Get all posts in the channel and convert them to dictionaries
-    posts = [post.to_dict(username=username) for post in channel.posts]
+    posts = Post.query.filter_by(channel_id=channel_id, deleted=False).all()
 
-    return posts, 200
+    return posts_response(posts, username)
 
 
-@app.route('/post/new', methods=["POST"])
+@bp.route('/post/new', methods=["POST"])
 @jwt_required()
 def new_post():
     # get query params
-    title = profanity.censor(request.json.get("title", None))
-    content = profanity.censor(request.json.get("content", None))
+    title = censor(request.json.get("title", None))
+    content = censor(request.json.get("content", None))
     channel_id = request.json.get("channel_id", None)
 
     # validate that params are sent in
@@ -243,23 +249,77 @@ def new_post():
         return {"msg": "Error fetching user from JWT token"}, 401
 
     # checking if the channel exists
-    channel = Channel.query.filter_by(id=channel_id).first()
+    channel = get_channels().get_channel(channel_id)
     if not channel:
         return {"msg": "Channel not found"}, 404
 
     # creating and adding the new post to the specified channel
-    post = Post(title=title, content=content, author=user, channel=channel)
+    post = Post(title=title, content=content,
+                author=user, channel_id=channel.id)
     db.session.add(post)
     db.session.commit()
 
+    # push the post into the followers' feeds in the background
+    tasks.submit(fan_out_post, post.id, post.channel_id)
+
     return {"msg": "Post created successfully"}, 200
 
 
-@app.route('/reply/<int:item_id>', methods=['POST'])
+@bp.route('/channel/<int:channel_id>/follow', methods=['POST'])
+@jwt_required()
+def follow_channel(channel_id):
+    username = get_jwt_identity()
+    if not username:
+        return {"msg": "Error fetching user"}, 401
+
+    # checking if the channel exists
+    if not get_channels().get_channel(channel_id):
+        return {"msg": "Channel not found"}, 404
+
+    follow = ChannelFollow.query.filter_by(
+        username=username, channel_id=channel_id).first()
+
+    if follow:
+        # User already follows this channel, so unfollow it and drop its posts from the feed
+        db.session.delete(follow)
+        TimelineEntry.query.filter_by(
+            username=username, channel_id=channel_id).delete()
+        db.session.commit()
+        return {"following": False}, 200
+
+    db.session.add(ChannelFollow(username=username, channel_id=channel_id))
+    db.session.commit()
+
+    # fill the feed with the channel's latest posts in the background
+    tasks.submit(backfill_timeline, username, channel_id)
+
+    return {"following": True}, 200
+
+
+@bp.route('/following')
+@jwt_required()
+def following():
+    username = get_jwt_identity()
+    follows = ChannelFollow.query.filter_by(username=username).all()
+    return {"channels": [follow.channel_id for follow in follows]}, 200
+
+
+@bp.route('/feed')
+@jwt_required()
+def feed():
+    username = get_jwt_identity()
+    # the feed is paginated by post id, pass the last id you got as "before"
+    before = request.args.get('before', None, type=int)
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    posts = get_feed(username, before=before, limit=limit)
+    return posts_response(posts, username)
+
+
+@bp.route('/reply/<int:item_id>', methods=['POST'])
 @jwt_required()
 def create_reply(item_id):
     # get query params
-    content = profanity.censor(request.json.get("content", None))
+    content = censor(request.json.get("content", None))
     parent_reply_id = request.json.get("parent_reply_id", None)
 
     # validate that params are sent in
@@ -273,7 +333,7 @@ def create_reply(item_id):
         return {"msg": "Error fetching user"}, 401
 
     # checking if the post exists
-    post = Post.query.filter_by(id=item_id).first()
+    post = Post.query.filter_by(id=item_id, deleted=False).first()
     if not post:
         return {"msg": "Post not found"}, 404
 
@@ -282,8 +342,9 @@ def create_reply(item_id):
 
     # Determine if this is a reply to a post or to another reply
     if parent_reply_id:
-        parent_reply = Reply.query.filter_by(id=parent_reply_id).first()
-        if not parent_reply:
+        parent_reply = Reply.query.filter_by(
+            id=parent_reply_id, deleted=False).first()
+        if not parent_reply or parent_reply.is_deleted():
             return {"msg": "Parent reply not found"}, 404
         depth = parent_reply.depth + 1
     else:
@@ -301,7 +362,7 @@ def create_reply(item_id):
     return {"msg": "Reply created successfully"}, 201
 
 
-@app.route('/delete/<item_type>/<int:item_id>', methods=['POST'])
+@bp.route('/delete/<item_type>/<int:item_id>', methods=['POST'])
 @jwt_required()
 def delete_item(item_type, item_id):
     username = get_jwt_identity()
@@ -311,13 +372,14 @@ def delete_item(item_type, item_id):
 
     # checking if the item exists
     if item_type == 'post':
-        item = Post.query.filter_by(id=item_id).first()
+        item = Post.query.filter_by(id=item_id, deleted=False).first()
     elif item_type == 'reply':
-        item = Reply.query.filter_by(id=item_id).first()
+        item = Reply.query.filter_by(id=item_id, deleted=False).first()
     else:
         return {"msg": "Invalid item type"}, 400
 
-    if not item:
+    # replies of deleted items are gone too, even before they are purged
+    if not item or item.is_deleted():
         return {"msg": "Item not found"}, 404
 
     # checking if the user is authorized to delete the item
@@ -326,22 +388,16 @@ def delete_item(item_type, item_id):
     elif item_type == 'reply' and item.username != username:
         return {"msg": "Unauthorized to delete this reply"}, 403
 
-    # recursively delete all child items
-    def delete_children(item):
-        for child in item.replies:
-            delete_children(child)
-            db.session.delete(child)
-
-    delete_children(item)
-
-    # delete the item object
-    db.session.delete(item)
+    # flag the item as deleted so it's hidden right away, the item and its
+    # replies and votes are then removed in the background
+    item.deleted = True
     db.session.commit()
+    tasks.submit(purge_item, item_type, item_id)
 
     return {"msg": item_type.capitalize() + " deleted successfully"}, 200
 
 
-@app.route('/edit/<item_type>/<int:item_id>', methods=['POST'])
+@bp.route('/edit/<item_type>/<int:item_id>', methods=['POST'])
 @jwt_required()
 def update_item(item_type, item_id):
     username = get_jwt_identity()
@@ -351,13 +407,14 @@ def update_item(item_type, item_id):
 
     # checking if the item is valid
     if item_type == 'post':
-        item = Post.query.filter_by(id=item_id).first()
+        item = Post.query.filter_by(id=item_id, deleted=False).first()
     elif item_type == 'reply':
-        item = Reply.query.filter_by(id=item_id).first()
+        item = Reply.query.filter_by(id=item_id, deleted=False).first()
     else:
         return {"msg": "Invalid item type"}, 400
 
-    if not item:
+    # replies of deleted items are gone too, even before they are purged
+    if not item or item.is_deleted():
         return {"msg": "Item not found"}, 404
 
     # checking if the user is authorized to update the item
@@ -368,14 +425,14 @@ def update_item(item_type, item_id):
 
     # validate that params are sent in
     if item_type == 'post':
-        title = profanity.censor(request.json.get("title", None))
+        title = censor(request.json.get("title", None))
 
         if title is None:
             return {"msg": "Title missing"}, 400
 
         item.title = title
 
-    content = profanity.censor(request.json.get("content", None))
+    content = censor(request.json.get("content", None))
 
     if content is None:
         return {"msg": "Content missing"}, 400
@@ -389,7 +446,7 @@ def update_item(item_type, item_id):
     return {"msg": item_type.capitalize() + " updated successfully"}, 200
 
 
-@app.route('/like/<item_type>/<int:item_id>', methods=['POST'])
+@bp.route('/like/<item_type>/<int:item_id>', methods=['POST'])
 @jwt_required()
 def like_item(item_type, item_id):
     username = get_jwt_identity()
@@ -398,16 +455,21 @@ def like_item(item_type, item_id):
 
     # checking if the item exists
     if item_type == 'post':
+        item = Post.query.filter_by(id=item_id).first()
         like_query = Like.query.filter_by(username=username, post_id=item_id)
         dislike_query = Dislike.query.filter_by(
             username=username, post_id=item_id)
     elif item_type == 'reply':
+        item = Reply.query.filter_by(id=item_id).first()
         like_query = Like.query.filter_by(username=username, reply_id=item_id)
         dislike_query = Dislike.query.filter_by(
             username=username, reply_id=item_id)
     else:
         return {"msg": "Invalid item type"}, 400
 
+    if not item or item.is_deleted():
+        return {"msg": "Item not found"}, 404
+
     username = get_jwt_identity()
 
     like = like_query.first()
@@ -415,6 +477,7 @@ def like_item(item_type, item_id):
     if like:
         # User has already liked this item, so remove the like
         db.session.delete(like)
+        vote = None
     else:
         dislike = dislike_query.first()
         if dislike:
@@ -426,12 +489,14 @@ def like_item(item_type, item_id):
         elif item_type == 'reply':
             new_like = Like(username=username, reply_id=item_id)
         db.session.add(new_like)
+        vote = 'like'
     db.session.commit()
+    vote_cache.record(username, item_type, item_id, vote)
 
     return {}, 200
 
 
-@app.route('/dislike/<item_type>/<int:item_id>', methods=['POST'])
+@bp.route('/dislike/<item_type>/<int:item_id>', methods=['POST'])
 @jwt_required()
 def dislike_item(item_type, item_id):
     username = get_jwt_identity()
@@ -440,16 +505,21 @@ def dislike_item(item_type, item_id):
 
     # checking if the item exists
     if item_type == 'post':
+        item = Post.query.filter_by(id=item_id).first()
         like_query = Like.query.filter_by(username=username, post_id=item_id)
         dislike_query = Dislike.query.filter_by(
             username=username, post_id=item_id)
     elif item_type == 'reply':
+        item = Reply.query.filter_by(id=item_id).first()
         like_query = Like.query.filter_by(username=username, reply_id=item_id)
         dislike_query = Dislike.query.filter_by(
             username=username, reply_id=item_id)
     else:
         return {"msg": "Invalid item type"}, 400
 
+    if not item or item.is_deleted():
+        return {"msg": "Item not found"}, 404
+
     username = get_jwt_identity()
 
     dislike = dislike_query.first()
@@ -457,6 +527,7 @@ def dislike_item(item_type, item_id):
     if dislike:
         # User has already disliked this item, so remove the dislike
         db.session.delete(dislike)
+        vote = None
     else:
         like = like_query.first()
         if like:
@@ -468,6 +539,8 @@ def dislike_item(item_type, item_id):
         elif item_type == 'reply':
             new_dislike = Dislike(username=username, reply_id=item_id)
         db.session.add(new_dislike)
+        vote = 'dislike'
     db.session.commit()
+    vote_cache.record(username, item_type, item_id, vote)
 
     return {}, 200
\ No newline at end of file
@@ -0,0 +1,68 @@
+import os
+import queue
+import threading
+from flask import current_app
+
+
+class TaskQueue:
+    """Runs functions off the request path in a background thread.
+
+    Tasks go through a local in-process queue and run inside an app context
+    of the app that submitted them. Tasks still queued when the process
+    exits are lost, so they must be recoverable (see run.py). With
+    TASK_QUEUE_MODE set to "inline" they run straight away instead, which
+    keeps tests deterministic.
+    """
+
+    def __init__(self, app=None):
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('TASK_QUEUE_MODE', 'thread')
+        app.extensions['task_queue'] = self
+
+    def submit(self, func, *args):
+        """Run func(*args) in the background. Needs an app context."""
+        app = current_app._get_current_object()
+        if app.config['TASK_QUEUE_MODE'] == 'inline':
+            self._run(app, func, args)
+        else:
+            self._ensure_worker().put((app, func, args))
+
+    def join(self):
+        """Block until every submitted task has run."""
+        if self._queue is not None:
+            self._queue.join()
+
+    def _ensure_worker(self):
+        # threads don't survive a fork, so every gunicorn worker starts its own
+        with self._lock:
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(
+                    target=self._work, args=(self._queue,), daemon=True)
+                self._thread.start()
+            return self._queue
+
+    def _work(self, tasks):
+        while True:
+            app, func, args = tasks.get()
+            try:
+                self._run(app, func, args)
+            finally:
+                tasks.task_done()
+
+    def _run(self, app, func, args):
+        # a fresh app context gives the task its own database session, which
+        # is removed (and rolled back if needed) when the context ends
+        with app.app_context():
+            try:
+                func(*args)
+            except Exception:
+                app.logger.exception("task %s failed", func.__name__)
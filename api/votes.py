@@ -0,0 +1,128 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from api import db
+
+# the liked/disliked flags on every post and reply used to cost two queries
+# each. instead the ids a user voted on are loaded once into sets and kept in
+# a bounded LRU cache, which like_item/dislike_item update in place
+
+# how many users' votes are kept in memory
+VOTE_CACHE_SIZE = 1000
+# seconds before a user's votes are reloaded, this bounds how long votes cast
+# through another gunicorn worker (which has its own cache) can be missed
+VOTE_CACHE_TTL = 600
+
+
+class UserVotes:
+    __slots__ = ('likes', 'dislikes', 'loaded_at')
+
+    def __init__(self, likes, dislikes):
+        # keyed by item type, e.g. likes['post'] is the set of liked post ids
+        self.likes = likes
+        self.dislikes = dislikes
+        self.loaded_at = time.monotonic()
+
+    @classmethod
+    def load(cls, username):
+        from api.models import Like, Dislike
+        votes = []
+        for model in (Like, Dislike):
+            rows = db.session.query(model.post_id, model.reply_id).filter_by(
+                username=username).all()
+            votes.append({
+                'post': {post_id for post_id, _ in rows if post_id is not None},
+                'reply': {reply_id for _, reply_id in rows if reply_id is not None},
+            })
+        return cls(*votes)
+
+    def liked(self, item_type, item_id):
+        return item_id in self.likes[item_type]
+
+    def disliked(self, item_type, item_id):
+        return item_id in self.dislikes[item_type]
+
+    def record(self, item_type, item_id, vote):
+        """Set the user's vote on an item to "like", "dislike" or None."""
+        self.likes[item_type].discard(item_id)
+        self.dislikes[item_type].discard(item_id)
+        if vote == 'like':
+            self.likes[item_type].add(item_id)
+        elif vote == 'dislike':
+            self.dislikes[item_type].add(item_id)
+
+
+class VoteCache:
+    def __init__(self, size=VOTE_CACHE_SIZE, ttl=VOTE_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._users = OrderedDict()
+        self._lock = Lock()
+        # users with loads in flight, mapped to [loads, generation]. record()
+        # bumps the generation, so a load that started before a vote was
+        # recorded knows its result may be missing that vote
+        self._loading = {}
+
+    def get(self, username):
+        """Return the votes of a user, loading them if they aren't cached. Needs an app context."""
+        with self._lock:
+            votes = self._users.get(username)
+            if votes and time.monotonic() - votes.loaded_at < self.ttl:
+                self._users.move_to_end(username)
+                return votes
+            loading = self._loading.setdefault(username, [0, 0])
+            loading[0] += 1
+            generation = loading[1]
+
+        try:
+            votes = UserVotes.load(username)
+        except Exception:
+            with self._lock:
+                self._done_loading(username, loading)
+            raise
+
+        with self._lock:
+            self._done_loading(username, loading)
+            if loading[1] != generation:
+                # don't cache it, the next request loads the votes again
+                return votes
+            self._users[username] = votes
+            self._users.move_to_end(username)
+            while len(self._users) > self.size:
+                self._users.popitem(last=False)
+        return votes
+
+    def _done_loading(self, username, loading):
+        loading[0] -= 1
+        if not loading[0]:
+            del self._loading[username]
+
+    def record(self, username, item_type, item_id, vote):
+        """Update a cached user's vote on an item after it was committed."""
+        with self._lock:
+            if username in self._loading:
+                self._loading[username][1] += 1
+            votes = self._users.get(username)
+            if votes:
+                votes.record(item_type, item_id, vote)
+
+    def forget(self, item_type, item_ids):
+        """Drop purged items from every cached user's votes, since their ids may be reused."""
+        item_ids = set(item_ids)
+        with self._lock:
+            # loads in flight may have read the votes before they were deleted
+            for loading in self._loading.values():
+                loading[1] += 1
+            for votes in self._users.values():
+                votes.likes[item_type] -= item_ids
+                votes.dislikes[item_type] -= item_ids
+
+    def clear(self):
+        """Drop every cached user's votes."""
+        with self._lock:
+            for loading in self._loading.values():
+                loading[1] += 1
+            self._users.clear()
+
+
+vote_cache = VoteCache()
@@ -0,0 +1,103 @@
+"""Measure feed response sizes and serialization time on generated data.
+
+Compares the default and compact (?format=compact) post formats, each sent
+uncompressed, gzipped and (if brotli is installed) brotli compressed.
+
+    python benchmarks/payload.py [--posts N] [--replies N] [--users N] [--runs N]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_jwt_extended import create_access_token  # noqa: E402
+from api import create_app, db  # noqa: E402
+from api.compression import brotli  # noqa: E402
+from api.models import User, Category, Channel, Post, Reply, Like, Dislike  # noqa: E402
+
+
+def generate(users, posts, replies):
+    random.seed(3340)
+    category = Category(name="General")
+    db.session.add(category)
+    db.session.flush()
+    channel = Channel(name="General", description="General discussions",
+                      category_id=category.id)
+    db.session.add(channel)
+    db.session.flush()
+
+    usernames = [f"user{i}" for i in range(users)]
+    db.session.add_all([User(username=username, display_name=username.capitalize(), password_hash="x")
+                        for username in usernames])
+
+    for i in range(posts):
+        post = Post(username=random.choice(usernames), title=f"Post number {i}",
+                    content="Lorem ipsum dolor sit amet. " * random.randint(1, 8), channel_id=channel.id)
+        db.session.add(post)
+        db.session.flush()
+        parents = [None]
+        for _ in range(replies):
+            parent = random.choice(parents)
+            reply = Reply(username=random.choice(usernames), content="Consectetur adipiscing elit. " * random.randint(1, 4),
+                          post_id=post.id, parent_reply_id=parent.id if parent else None,
+                          depth=parent.depth + 1 if parent else 0)
+            db.session.add(reply)
+            db.session.flush()
+            if reply.depth < 5:
+                parents.append(reply)
+        for username in random.sample(usernames, min(len(usernames), 5)):
+            vote = Like if random.random() < 0.7 else Dislike
+            db.session.add(vote(username=username, post_id=post.id))
+    db.session.commit()
+    return usernames[0]
+
+
+def measure(client, token, fmt, encoding, runs):
+    headers = {"Authorization": f"Bearer {token}",
+               "Accept-Encoding": encoding or "identity"}
+    url = "/post/all" + ("?format=compact" if fmt == "compact" else "")
+    wall, cpu = [], []
+    for _ in range(runs):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        response = client.get(url, headers=headers)
+        wall.append(time.perf_counter() - wall_start)
+        cpu.append(time.process_time() - cpu_start)
+    assert response.status_code == 200, response.status_code
+    return len(response.data), statistics.median(wall) * 1000, statistics.median(cpu) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=200)
+    parser.add_argument('--replies', type=int, default=10)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite://",
+        "SECRET_KEY": "benchmark",
+        "JWT_SECRET_KEY": "benchmark",
+        "TASK_QUEUE_MODE": "inline",
+    })
+    with app.app_context():
+        db.create_all()
+        viewer = generate(args.users, args.posts, args.replies)
+        token = create_access_token(identity=viewer)
+
+    client = app.test_client()
+    encodings = [None, "gzip"] + (["br"] if brotli else [])
+    print(f"{args.posts} posts, {args.replies} replies each, {args.users} users")
+    print(f"{'format':<10}{'encoding':<10}{'bytes':>10}{'wall ms':>10}{'cpu ms':>10}")
+    for fmt in ("default", "compact"):
+        for encoding in encodings:
+            size, wall, cpu = measure(client, token, fmt, encoding, args.runs)
+            print(f"{fmt:<10}{encoding or 'none':<10}{size:>10}{wall:>10.1f}{cpu:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
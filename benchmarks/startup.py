@@ -0,0 +1,73 @@
+"""Measure cold start time of the api.
+
+Every sample runs in a fresh interpreter, so nothing is cached between runs.
+
+    python benchmarks/startup.py [--runs N] [--with-db]
+
+--with-db also loads the channel registry, which needs DATABASE_URI to point
+at a set up database. Without it an in-memory SQLite database is used.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# runs in the child interpreter and prints the timings of each startup stage
+PROBE = """
+import json, time
+timings = {}
+start = time.perf_counter()
+import api
+timings['import api'] = time.perf_counter() - start
+
+t = time.perf_counter()
+app = api.create_app()
+timings['create_app'] = time.perf_counter() - t
+
+t = time.perf_counter()
+from api.filters import load_profanity
+load_profanity()
+timings['load profanity'] = time.perf_counter() - t
+
+if WITH_DB:
+    t = time.perf_counter()
+    from api.channels import load_channels
+    with app.app_context():
+        load_channels()
+    timings['load channels'] = time.perf_counter() - t
+
+timings['total'] = time.perf_counter() - start
+print(json.dumps(timings))
+"""
+
+
+def sample(with_db):
+    env = dict(os.environ)
+    if not with_db:
+        env['DATABASE_URI'] = 'sqlite://'
+    env.setdefault('SECRET_KEY', 'benchmark')
+    env.setdefault('JWT_SECRET_KEY', 'benchmark')
+    out = subprocess.run([sys.executable, '-c', f"WITH_DB = {with_db}\n" + PROBE],
+                         cwd=ROOT, env=env, check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--with-db', action='store_true')
+    args = parser.parse_args()
+
+    samples = [sample(args.with_db) for _ in range(args.runs)]
+    print(f"{'stage':<16}{'min ms':>10}{'median ms':>12}{'max ms':>10}")
+    for stage in samples[0]:
+        values = [s[stage] * 1000 for s in samples]
+        print(f"{stage:<16}{min(values):>10.1f}{statistics.median(values):>12.1f}{max(values):>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,51 @@
 import os
 import sys
-from api import app, db
-from api.models import Category, Channel, Role
+from api import create_app, db
+from api.models import Category, Channel, Role, Post, Reply
+from api.purge import purge_deleted
+from api.feed import rebuild_timelines
 from dotenv import load_dotenv
 from flask_migrate import Migrate
 load_dotenv()
 
+app = create_app()
 migrate = Migrate(app, db)
 
 
+# columns added to existing tables, with the sql default for existing rows.
+# db.create_all() only creates missing tables, so these are added by upgrade_db
+ADDED_COLUMNS = [
+    (Post, 'deleted', '0'),
+    (Reply, 'deleted', '0'),
+]
+
+
+def upgrade_db():
+    print("upgrading tables ...")
+    inspector = db.inspect(db.engine)
+    quote = db.engine.dialect.identifier_preparer.quote
+    for model, name, default in ADDED_COLUMNS:
+        table = model.__table__
+        if name in [column['name'] for column in inspector.get_columns(table.name)]:
+            continue
+        print(f"adding column {table.name}.{name} ...")
+        column_type = table.c[name].type.compile(dialect=db.engine.dialect)
+        with db.engine.begin() as connection:
+            connection.execute(db.text(
+                f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(name)} {column_type} NOT NULL DEFAULT {default}"))
+            for index in table.indexes:
+                if name in index.columns:
+                    index.create(connection)
+    print("done upgrading tables!")
+
+
 def setup_db():
     import json
     print("setting up db ...")
     print("creating tables...")
     with app.app_context():
         db.create_all()
+        upgrade_db()
 
         # check if the categories table is empty
         if Category.query.count() == 0:
@@ -66,6 +97,22 @@ def reset_categories():
         print("done resetting categories!")
 
 
+def purge_db():
+    # remove items that were deleted but not purged yet, e.g. after a restart
+    with app.app_context():
+        print("purging deleted items ...")
+        purge_deleted()
+        print("done purging deleted items!")
+
+
+def rebuild_feeds():
+    # pending fan-outs are lost when the server stops, this pushes them again
+    with app.app_context():
+        print("rebuilding feeds ...")
+        rebuild_timelines()
+        print("done rebuilding feeds!")
+
+
 # running the app
 if __name__ == '__main__':
     if len(sys.argv) > 2:
@@ -83,6 +130,10 @@ if __name__ == '__main__':
                 elif sys.argv[1] == 'update':
                     reset_categories()
                     setup_db()
+                elif sys.argv[1] == 'purge':
+                    purge_db()
+                elif sys.argv[1] == 'rebuild-feeds':
+                    rebuild_feeds()
                 else:
                     print("unknown argument, exiting")
                     exit(1)
@@ -90,7 +141,10 @@ if __name__ == '__main__':
         # PROD
         if os.getenv('ENVIRONMENT') == "prod":
             print('<< PRODUCTION >>')
-            os.system(f"gunicorn -b '0.0.0.0:{os.getenv('PORT')}' api:app")
+            # --preload builds the app and its heavy state once in the master,
+            # the workers then share it copy-on-write
+            os.system(
+                f"gunicorn --preload -b '0.0.0.0:{os.getenv('PORT')}' wsgi:app")
 
         # DEV
         elif os.getenv('ENVIRONMENT') == 'dev':
@@ -0,0 +1,52 @@
+import pytest
+from flask_jwt_extended import create_access_token
+from api import create_app, db
+from api import channels
+from api.votes import vote_cache
+from api.models import User, Category, Channel
+
+
+@pytest.fixture
+def app():
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": "sqlite://",
+        "SECRET_KEY": "test-secret-key",
+        "JWT_SECRET_KEY": "test-jwt-secret-key-that-is-long-enough",
+        "TASK_QUEUE_MODE": "inline",
+    })
+    # the channel registry and vote cache are shared by the whole process
+    channels._registry = None
+    vote_cache._users.clear()
+
+    with app.app_context():
+        db.create_all()
+        category = Category(name="General")
+        db.session.add(category)
+        db.session.flush()
+        db.session.add_all([
+            Channel(name="General", description="General discussions",
+                    category_id=category.id),
+            Channel(name="Resources", description="Resources for learning",
+                    category_id=category.id),
+        ])
+        db.session.add_all([User(username=username, display_name=username.capitalize(), password_hash="x")
+                            for username in ("alice", "bob", "carol")])
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+    channels._registry = None
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth(app):
+    def auth(username):
+        return {"Authorization": f"Bearer {create_access_token(identity=username)}"}
+    return auth
@@ -0,0 +1,39 @@
+from api import channels, db
+from api.channels import get_channels
+from api.models import Channel
+
+
+def test_get_channel(client, auth):
+    response = client.get("/channel/1", headers=auth("alice"))
+    assert response.status_code == 200
+    assert response.json == {"id": 1, "name": "General",
+                             "description": "General discussions"}
+    assert client.get("/channel/99", headers=auth("alice")).status_code == 404
+
+
+def test_get_channel_id_types(app):
+    registry = get_channels()
+    assert registry.get_channel(1).name == "General"
+    assert registry.get_channel("2").name == "Resources"
+    for channel_id in (True, 1.9, 1.0, "1.0", "-1", "", None, [1]):
+        assert registry.get_channel(channel_id) is None
+
+
+def test_new_post_rejects_non_integer_channel(client, auth):
+    response = client.post("/post/new", headers=auth("alice"),
+                           json={"title": "t", "content": "c", "channel_id": True})
+    assert response.status_code == 404
+
+
+def test_registry_reloads_when_tables_change(app, monkeypatch):
+    registry = get_channels()
+    assert get_channels() is registry
+
+    db.session.add(Channel(name="Suggestions",
+                   description="Suggestions", category_id=1))
+    db.session.commit()
+
+    # still cached until the version is checked again
+    assert get_channels() is registry
+    monkeypatch.setattr(channels, "CHANNEL_REGISTRY_TTL", 0)
+    assert get_channels().get_channel(3).name == "Suggestions"
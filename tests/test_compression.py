@@ -0,0 +1,45 @@
+import gzip
+from api import db
+from api.models import Post, Reply
+
+
+def add_posts(count):
+    for i in range(count):
+        post = Post(username=("alice", "bob")[i % 2], title=f"Post {i}",
+                    content="Lorem ipsum dolor sit amet. " * 5, channel_id=1)
+        db.session.add(post)
+        db.session.flush()
+        db.session.add(Reply(username="carol", content="reply",
+                       post_id=post.id, depth=0))
+    db.session.commit()
+
+
+def test_compact_format_references_authors_by_id(client, auth):
+    add_posts(3)
+    response = client.get("/post/all?format=compact", headers=auth("alice"))
+    authors = {author["id"]: author for author in response.json["authors"]}
+    assert len(authors) == 3
+
+    for post in response.json["posts"]:
+        assert isinstance(post["date"], int)
+        assert post["author"] in authors
+        for reply in post["replies"]:
+            assert authors[reply["author"]]["username"] == "carol"
+
+
+def test_large_responses_are_gzipped(client, auth):
+    add_posts(20)
+    headers = dict(auth("alice"), **{"Accept-Encoding": "gzip"})
+    plain = client.get("/post/all", headers=auth("alice"))
+    compressed = client.get("/post/all", headers=headers)
+
+    assert "Content-Encoding" not in plain.headers
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in compressed.headers["Vary"]
+    assert gzip.decompress(compressed.data) == plain.data
+
+
+def test_small_responses_are_not_compressed(client, auth):
+    headers = dict(auth("alice"), **{"Accept-Encoding": "gzip"})
+    response = client.get("/channel/1", headers=headers)
+    assert "Content-Encoding" not in response.headers
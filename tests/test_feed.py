@@ -0,0 +1,164 @@
+from flask import current_app
+from api import create_app, db, feed, tasks
+from api.feed import backfill_timeline, fan_out_post, rebuild_timelines
+from api.models import ChannelFollow, Post, TimelineEntry
+
+
+def new_post(client, auth, username="alice", channel_id=1, title="title"):
+    response = client.post("/post/new", headers=auth(username),
+                           json={"title": title, "content": "content", "channel_id": channel_id})
+    assert response.status_code == 200
+    return Post.query.order_by(Post.id.desc()).first().id
+
+
+def timeline(username):
+    return [post_id for (post_id,) in db.session.query(TimelineEntry.post_id).filter_by(
+        username=username).order_by(TimelineEntry.post_id.desc())]
+
+
+def test_fan_out_reaches_followers_only(client, auth):
+    client.post("/channel/1/follow", headers=auth("bob"))
+    client.post("/channel/2/follow", headers=auth("carol"))
+
+    post_id = new_post(client, auth, channel_id=1)
+
+    assert timeline("bob") == [post_id]
+    assert timeline("carol") == []
+    response = client.get("/feed", headers=auth("bob"))
+    assert [post["id"] for post in response.json] == [post_id]
+
+
+def test_fan_out_skips_posts_already_in_a_timeline(app):
+    db.session.add_all([ChannelFollow(username=username, channel_id=1)
+                        for username in ("alice", "bob")])
+    post = Post(username="alice", title="t", content="c", channel_id=1)
+    db.session.add(post)
+    db.session.flush()
+    # e.g. pushed by a backfill in another worker
+    db.session.add(TimelineEntry(username="bob",
+                   post_id=post.id, channel_id=1))
+    db.session.commit()
+
+    fan_out_post(post.id, 1)
+
+    assert timeline("alice") == [post.id]
+    assert timeline("bob") == [post.id]
+
+
+def test_fan_out_batches(app, monkeypatch):
+    monkeypatch.setattr(feed, "FANOUT_BATCH_SIZE", 2)
+    db.session.add_all([ChannelFollow(username=username, channel_id=1)
+                        for username in ("alice", "bob", "carol")])
+    post = Post(username="alice", title="t", content="c", channel_id=1)
+    db.session.add(post)
+    db.session.commit()
+
+    fan_out_post(post.id, 1)
+
+    assert TimelineEntry.query.filter_by(post_id=post.id).count() == 3
+
+
+def test_timeline_evicts_oldest_posts(client, auth, monkeypatch):
+    monkeypatch.setattr(feed, "TIMELINE_LENGTH", 3)
+    monkeypatch.setattr(feed, "TIMELINE_SLACK", 1)
+    client.post("/channel/1/follow", headers=auth("bob"))
+
+    post_ids = [new_post(client, auth, title=str(i)) for i in range(10)]
+
+    entries = timeline("bob")
+    assert len(entries) <= 4
+    assert entries[:3] == post_ids[::-1][:3]
+
+
+def test_follow_backfills_and_unfollow_clears(client, auth):
+    post_ids = [new_post(client, auth) for _ in range(3)]
+    other = new_post(client, auth, channel_id=2)
+
+    response = client.post("/channel/1/follow", headers=auth("bob"))
+    assert response.json == {"following": True}
+    assert timeline("bob") == post_ids[::-1]
+    assert client.get("/following", headers=auth("bob")
+                      ).json == {"channels": [1]}
+
+    response = client.post("/channel/1/follow", headers=auth("bob"))
+    assert response.json == {"following": False}
+    assert timeline("bob") == []
+    assert other not in timeline("bob")
+    assert client.get("/following", headers=auth("bob")
+                      ).json == {"channels": []}
+
+
+def test_follow_unknown_channel(client, auth):
+    assert client.post("/channel/99/follow",
+                       headers=auth("bob")).status_code == 404
+
+
+def test_backfill_after_unfollow_does_nothing(client, auth):
+    new_post(client, auth)
+    # the backfill was queued by a follow that has been undone since
+    backfill_timeline("bob", 1)
+    assert timeline("bob") == []
+
+
+def test_rebuild_restores_lost_fan_outs(client, auth):
+    client.post("/channel/1/follow", headers=auth("bob"))
+    post_id = new_post(client, auth)
+    TimelineEntry.query.delete()
+    db.session.commit()
+
+    rebuild_timelines()
+
+    assert timeline("bob") == [post_id]
+
+
+def test_feed_pagination_and_limit(client, auth):
+    client.post("/channel/1/follow", headers=auth("bob"))
+    post_ids = [new_post(client, auth) for _ in range(5)][::-1]
+
+    def feed_ids(query):
+        response = client.get("/feed" + query, headers=auth("bob"))
+        assert response.status_code == 200
+        return [post["id"] for post in response.json]
+
+    assert feed_ids("?limit=2") == post_ids[:2]
+    assert feed_ids(f"?limit=2&before={post_ids[1]}") == post_ids[2:4]
+    assert feed_ids("?limit=0") == post_ids[:1]
+    assert feed_ids("?limit=-1") == post_ids[:1]
+
+
+def test_tasks_run_in_the_submitting_app(app):
+    other = create_app({"SQLALCHEMY_DATABASE_URI": "sqlite://",
+                        "TASK_QUEUE_MODE": "thread"})
+    seen = []
+
+    def task():
+        seen.append(current_app._get_current_object())
+
+    with other.app_context():
+        tasks.submit(task)
+    tasks.join()
+    # creating another app must not rebind tasks submitted by this one
+    app.config["TASK_QUEUE_MODE"] = "thread"
+    tasks.submit(task)
+    tasks.join()
+
+    assert seen == [other, app]
+
+
+def test_fan_out_skips_users_who_unfollowed_meanwhile(client, auth, monkeypatch):
+    client.post("/channel/1/follow", headers=auth("bob"))
+    client.post("/channel/1/follow", headers=auth("carol"))
+    insert_entries = feed._insert_entries
+
+    def unfollow_then_insert():
+        # bob unfollows after the fan-out read the followers, before it inserts
+        client.post("/channel/1/follow", headers=auth("bob"))
+        monkeypatch.setattr(feed, "_insert_entries", insert_entries)
+        return insert_entries()
+
+    monkeypatch.setattr(feed, "_insert_entries", unfollow_then_insert)
+    post_id = new_post(client, auth)
+
+    assert timeline("bob") == []
+    assert timeline("carol") == [post_id]
+    assert client.get("/feed", headers=auth("bob")).json == []
@@ -0,0 +1,129 @@
+import pytest
+from sqlalchemy import event
+from api import db, purge
+from api.models import Post, Reply, Like, Dislike, TimelineEntry
+from api.purge import purge_deleted, purge_post, purge_reply
+
+
+@pytest.fixture
+def thread(app):
+    """A post with a reply chain 0 <- 1 <- 2 and a second top level reply 3."""
+    post = Post(username="alice", title="t", content="c", channel_id=1)
+    db.session.add(post)
+    db.session.flush()
+    replies = []
+    for parent in (None, 0, 1, None):
+        reply = Reply(username="bob", content="r", post_id=post.id,
+                      parent_reply_id=replies[parent].id if parent is not None else None,
+                      depth=replies[parent].depth + 1 if parent is not None else 0)
+        db.session.add(reply)
+        db.session.flush()
+        replies.append(reply)
+    for reply in replies:
+        db.session.add(Like(username="carol", reply_id=reply.id))
+        db.session.add(Dislike(username="alice", reply_id=reply.id))
+    db.session.add(Like(username="bob", post_id=post.id))
+    db.session.add(TimelineEntry(username="bob", post_id=post.id, channel_id=1))
+    db.session.commit()
+    return post.id, [reply.id for reply in replies]
+
+
+@pytest.fixture
+def deletes(app):
+    """Record how many rows every DELETE statement removed."""
+    rowcounts = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("DELETE"):
+            rowcounts.append(cursor.rowcount)
+
+    event.listen(db.engine, "after_cursor_execute", record)
+    yield rowcounts
+    event.remove(db.engine, "after_cursor_execute", record)
+
+
+def test_purge_post(thread):
+    post_id, _ = thread
+    purge_post(post_id)
+    for model in (Post, Reply, Like, Dislike, TimelineEntry):
+        assert model.query.count() == 0
+
+
+def test_purge_reply_removes_only_its_subtree(thread):
+    post_id, reply_ids = thread
+    purge_reply(reply_ids[0])
+    assert [reply.id for reply in Reply.query.all()] == [reply_ids[3]]
+    assert {like.reply_id for like in Like.query.all()} == {reply_ids[3], None}
+    assert [dislike.reply_id for dislike in Dislike.query.all()] == [reply_ids[3]]
+    assert db.session.get(Post, post_id)
+
+
+def test_purge_deletes_in_batches(thread, deletes, monkeypatch):
+    monkeypatch.setattr(purge, "PURGE_BATCH_SIZE", 2)
+    post_id, _ = thread
+    purge_post(post_id)
+    assert Reply.query.count() == 0
+    assert deletes and max(deletes) <= 2
+
+
+def test_purge_rescans_for_new_replies(thread, monkeypatch):
+    post_id, reply_ids = thread
+    delete_replies = purge._delete_replies
+    created = []
+
+    def delete_replies_and_reply(ids):
+        delete_replies(ids)
+        # a reply committed while the subtree is being purged
+        if not created:
+            reply = Reply(username="bob", content="late", post_id=post_id,
+                          parent_reply_id=reply_ids[1], depth=2)
+            db.session.add(reply)
+            db.session.commit()
+            created.append(reply.id)
+
+    monkeypatch.setattr(purge, "_delete_replies", delete_replies_and_reply)
+    purge_reply(reply_ids[0])
+    assert [reply.id for reply in Reply.query.all()] == [reply_ids[3]]
+
+
+def test_purge_deleted_removes_flagged_items_and_orphans(thread):
+    post_id, reply_ids = thread
+    Reply.query.filter_by(id=reply_ids[0]).update({"deleted": True})
+    # votes and a reply left behind by writes that raced an earlier purge
+    db.session.add(Like(username="bob", post_id=12345))
+    db.session.add(Reply(username="bob", content="r", post_id=12345, depth=0))
+    db.session.commit()
+
+    purge_deleted()
+
+    assert [reply.id for reply in Reply.query.all()] == [reply_ids[3]]
+    assert {like.post_id for like in Like.query.all()} == {post_id, None}
+
+
+def test_writes_to_replies_of_deleted_items_are_rejected(client, auth, thread):
+    post_id, reply_ids = thread
+    # deleted but not purged yet, nested replies aren't flagged themselves
+    Reply.query.filter_by(id=reply_ids[0]).update({"deleted": True})
+    db.session.commit()
+    nested = reply_ids[2]
+    assert not db.session.get(Reply, nested).deleted
+
+    assert client.post(f"/reply/{post_id}", headers=auth("bob"),
+                       json={"content": "r", "parent_reply_id": nested}).status_code == 404
+    assert client.post(f"/edit/reply/{nested}", headers=auth("bob"),
+                       json={"content": "r"}).status_code == 404
+    assert client.post(f"/like/reply/{nested}", headers=auth("bob")).status_code == 404
+    assert client.post(f"/dislike/reply/{nested}", headers=auth("bob")).status_code == 404
+    assert client.post(f"/delete/reply/{nested}", headers=auth("bob")).status_code == 404
+    assert db.session.get(Reply, nested) is not None
+    assert client.post(f"/like/reply/{reply_ids[3]}", headers=auth("bob")).status_code == 200
+
+
+def test_votes_on_deleted_or_missing_posts_are_rejected(client, auth, thread):
+    post_id, _ = thread
+    assert client.post("/like/post/12345", headers=auth("bob")).status_code == 404
+    Post.query.filter_by(id=post_id).update({"deleted": True})
+    db.session.commit()
+    assert client.post(f"/like/post/{post_id}", headers=auth("bob")).status_code == 404
+    assert client.post(f"/dislike/post/{post_id}", headers=auth("bob")).status_code == 404
+    assert client.get("/post/all", headers=auth("bob")).json == []
@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# runs in a fresh interpreter, the test process may have imported better_profanity already
+PROBE = """
+import sys
+import api
+from api import db
+
+app = api.create_app({"SQLALCHEMY_DATABASE_URI": "sqlite://"})
+assert "better_profanity" not in sys.modules, "imported by create_app"
+
+with app.app_context():
+    db.create_all()
+api.warm_up(app)
+assert "better_profanity" in sys.modules, "not imported by warm_up"
+
+from api.filters import censor
+assert censor("shit") == "****"
+"""
+
+
+def test_profanity_filter_is_loaded_lazily():
+    result = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT,
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+
+def test_create_app_builds_independent_apps():
+    from api import create_app
+    first = create_app({"SQLALCHEMY_DATABASE_URI": "sqlite://"})
+    second = create_app({"SQLALCHEMY_DATABASE_URI": "sqlite://"})
+    assert first is not second
+    assert "api.ping" in first.view_functions
+    assert "api.ping" in second.view_functions
@@ -0,0 +1,76 @@
+from api import db
+from api.models import Post, Like
+from api.votes import UserVotes, VoteCache
+
+
+def test_like_and_dislike_update_the_cached_flags(client, auth):
+    db.session.add(Post(username="alice", title="t", content="c", channel_id=1))
+    db.session.commit()
+
+    def flags():
+        post = client.get("/post/all", headers=auth("bob")).json[0]
+        return post["liked"], post["disliked"]
+
+    assert flags() == (False, False)
+    client.post("/like/post/1", headers=auth("bob"))
+    assert flags() == (True, False)
+    client.post("/dislike/post/1", headers=auth("bob"))
+    assert flags() == (False, True)
+    client.post("/dislike/post/1", headers=auth("bob"))
+    assert flags() == (False, False)
+
+
+def test_vote_recorded_during_a_load_is_not_lost(app, monkeypatch):
+    cache = VoteCache()
+    load = UserVotes.load
+
+    def load_then_vote(username):
+        votes = load(username)
+        # the like commits after the load read the votes but before it is cached
+        db.session.add(Like(username=username, post_id=1))
+        db.session.commit()
+        cache.record(username, 'post', 1, 'like')
+        return votes
+
+    monkeypatch.setattr(UserVotes, "load", load_then_vote)
+    assert not cache.get("bob").liked('post', 1)
+
+    monkeypatch.setattr(UserVotes, "load", load)
+    assert cache.get("bob").liked('post', 1)
+
+
+def test_cache_is_bounded(app):
+    cache = VoteCache(size=2)
+    for username in ("alice", "bob", "carol"):
+        cache.get(username)
+    assert list(cache._users) == ["bob", "carol"]
+
+
+def test_purged_ids_are_dropped_from_cached_votes(client, auth):
+    def new_post():
+        client.post("/post/new", headers=auth("alice"),
+                    json={"title": "t", "content": "c", "channel_id": 1})
+        return Post.query.order_by(Post.id.desc()).first().id
+
+    post_id = new_post()
+    client.post(f"/like/post/{post_id}", headers=auth("bob"))
+    assert client.get("/post/all", headers=auth("bob")).json[0]["liked"]
+
+    # tasks run inline in tests, so this also purges the post
+    client.post(f"/delete/post/{post_id}", headers=auth("alice"))
+    # SQLite hands out the purged id again
+    assert new_post() == post_id
+
+    post = client.get("/post/all", headers=auth("bob")).json[0]
+    assert post["likes"] == 0
+    assert not post["liked"]
+
+
+def test_purged_replies_are_dropped_from_cached_votes(app):
+    cache = VoteCache()
+    db.session.add(Like(username="bob", reply_id=7))
+    db.session.commit()
+    assert cache.get("bob").liked('reply', 7)
+
+    cache.forget('reply', [7])
+    assert not cache.get("bob").liked('reply', 7)
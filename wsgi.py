@@ -0,0 +1,5 @@
+from api import create_app, warm_up
+
+# entry point for gunicorn, see run.py
+app = create_app()
+warm_up(app)